@@ -1,8 +1,9 @@
 import importlib.util
 import sys
 from abc import ABCMeta
+from functools import cache
 from pathlib import Path
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, Generator, List, Optional
 
 from .config import cfg
 
@@ -11,6 +12,7 @@ class Function:
     def __init__(self, path: str):
         module = self._read(path)
         self._function = module.Function.execute
+        self._stream = getattr(module.Function, "execute_stream", None)
         self._openai_schema = module.Function.openai_schema
         self._name = self._openai_schema["name"]
 
@@ -26,6 +28,14 @@ class Function:
     def execute(self) -> Callable[..., str]:
         return self._function  # type: ignore
 
+    @property
+    def stream(self) -> Optional[Callable[..., Generator[str, None, str]]]:
+        """
+        Optional variant of execute, which yields output as it arrives
+        and returns the same result as execute.
+        """
+        return self._stream
+
     @classmethod
     def _read(cls, path: str) -> Any:
         module_name = path.replace("/", ".").rstrip(".py")
@@ -48,15 +58,37 @@ class Function:
 
 functions_folder = Path(cfg.get("OPENAI_FUNCTIONS_PATH"))
 functions_folder.mkdir(parents=True, exist_ok=True)
-functions = [Function(str(path)) for path in functions_folder.glob("*.py")]
 
 
-def get_function(name: str) -> Callable[..., Any]:
-    for function in functions:
+@cache
+def get_functions() -> List[Function]:
+    # Loaded on first use, so function modules (and their dependencies)
+    # are never imported when function calls are disabled.
+    functions: List[Function] = []
+    for path in functions_folder.glob("*.py"):
+        try:
+            functions.append(Function(str(path)))
+        except ImportError as error:
+            # Function opted out itself, e.g. not supported on this platform.
+            if error.path != str(path):
+                raise
+    return functions
+
+
+def _find_function(name: str) -> Function:
+    for function in get_functions():
         if function.name == name:
-            return function.execute
+            return function
     raise ValueError(f"Function {name} not found")
 
 
+def get_function(name: str) -> Callable[..., Any]:
+    return _find_function(name).execute
+
+
+def get_function_stream(name: str) -> Optional[Callable[..., Any]]:
+    return _find_function(name).stream
+
+
 def get_openai_schemas() -> List[Dict[str, Any]]:
-    return [function.openai_schema for function in functions]
+    return [function.openai_schema for function in get_functions()]
@@ -4,7 +4,7 @@ from typing import Any, Callable, Dict, Generator, List, Optional
 
 from ..cache import Cache
 from ..config import cfg
-from ..function import get_function
+from ..function import get_function, get_function_stream
 from ..printer import MarkdownPrinter, Printer, TextPrinter
 from ..role import DefaultRoles, SystemRole
 
@@ -75,9 +75,17 @@ class Handler:
         joined_args = ", ".join(f'{k}="{v}"' for k, v in dict_args.items())
         yield f"> @FunctionCall `{name}({joined_args})` \n\n"
 
-        result = get_function(name)(**dict_args)
-        if cfg.get("SHOW_FUNCTIONS_OUTPUT") == "true":
-            yield f"```text\n{result}\n```\n"
+        show_output = cfg.get("SHOW_FUNCTIONS_OUTPUT") == "true"
+        stream = get_function_stream(name) if show_output else None
+        if stream:
+            # Output is shown as it arrives, e.g. for long running commands.
+            yield "```text\n"
+            result = yield from stream(**dict_args)
+            yield "\n```\n"
+        else:
+            result = get_function(name)(**dict_args)
+            if show_output:
+                yield f"```text\n{result}\n```\n"
         messages.append({"role": "function", "content": result, "name": name})
 
     @cache
@@ -1,8 +1,149 @@
+import codecs
+import functools
+import os
+import re
+import shlex
+import signal
 import subprocess
+import threading
+import uuid
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple
 
 from instructor import OpenAISchema
 from pydantic import Field
 
+# Output beyond this is of no use for LLM context, command is terminated.
+MAX_OUTPUT_BYTES = 64 * 1024
+TRUNCATED = b"\n...[truncated]"
+SHELL_SYNTAX = re.compile(r"[|&;<>$`*?~()\[\]{}#!=\\\"'\n]")
+# sh builtins and keywords, their binaries (if any) may behave differently.
+SHELL_BUILTINS = frozenset(
+    """
+    . : [ alias bg break case cd command continue do done echo elif else esac
+    eval exec exit export false fc fg fi for getopts hash if in jobs kill local
+    printf pwd read readonly return set shift test then time times trap true
+    type ulimit umask unalias unset until wait while
+    """.split()
+)
+
+
+class ShellCoprocess:
+    """
+    Long-lived /bin/sh fed with commands one by one, so a burst of
+    commands doesn't pay for spawning a new shell every time.
+
+    It is used only when /dev/tty cannot be opened (sgpt has no terminal,
+    so nothing could prompt anyway). Commands then run with stdin from
+    /dev/null and with environment and working directory captured when the
+    shell was started, so they may behave differently than with a terminal.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._process: Optional["subprocess.Popen[bytes]"] = None
+        marker = f"__SGPT_EOF_{uuid.uuid4().hex}_".encode()
+        self._marker = marker
+        self._end = re.compile(re.escape(marker) + rb"(\d+)__\n")
+        # Matches what might be the beginning of the end marker.
+        self._partial = re.compile(
+            b"|".join(re.escape(marker[:i]) for i in range(1, len(marker)))
+            + b"|"
+            + re.escape(marker)
+            + rb"\d*_{0,2}"
+        )
+        self._tail = len(marker) + 8
+
+    def run(self, shell_command: str) -> Optional[Generator[bytes, None, int]]:
+        """
+        Returns generator yielding output of the shell command and returning
+        exit code, None if the shell is still busy with another command.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        output = self._run(shell_command)
+        # Enters the generator, from now on it releases the lock when done.
+        next(output)
+        return output
+
+    def _run(self, shell_command: str) -> Generator[bytes, None, int]:
+        # Subshell keeps "cd", "exit" or syntax errors from affecting the shell.
+        script = (
+            f"( eval {shlex.quote(shell_command)} ) </dev/null 2>&1\n"
+            f"printf '{self._marker.decode()}%d__\\n' \"$?\"\n"
+        ).encode()
+        try:
+            yield b""
+            try:
+                try:
+                    process = self._send(script)
+                except BrokenPipeError:
+                    self.stop()
+                    process = self._send(script)
+                stdout = process.stdout.fileno()
+                buffer = bytearray()
+                while True:
+                    if not (chunk := os.read(stdout, 65536)):
+                        raise ChildProcessError("Shell exited unexpectedly.")
+                    buffer += chunk
+                    if end := self._end.search(buffer):
+                        if end.start():
+                            yield bytes(buffer[: end.start()])
+                        return int(end[1])
+                    # Only a possibly incomplete end marker is held back.
+                    if pending := self._pending(buffer):
+                        yield bytes(buffer[:pending])
+                        del buffer[:pending]
+            except BaseException:
+                # Output of interrupted command would leak into the next one.
+                self.stop()
+                raise
+        finally:
+            self._lock.release()
+
+    def _pending(self, buffer: bytearray) -> int:
+        start = max(0, len(buffer) - self._tail)
+        while (start := buffer.find(b"_", start)) != -1:
+            if self._partial.fullmatch(buffer, start):
+                return start
+            start += 1
+        return len(buffer)
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.communicate()
+
+    def _send(self, script: bytes) -> "subprocess.Popen[bytes]":
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["/bin/sh"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                # Own process group, so commands can be killed along with it.
+                start_new_session=True,
+            )
+        self._process.stdin.write(script)
+        self._process.stdin.flush()
+        return self._process
+
+
+shell = ShellCoprocess()
+
+
+@functools.cache
+def has_terminal() -> bool:
+    try:
+        os.close(os.open("/dev/tty", os.O_RDWR | os.O_NOCTTY))
+    except OSError:
+        return False
+    return True
+
 
 class Function(OpenAISchema):
     """
@@ -19,10 +160,159 @@ class Function(OpenAISchema):
         title = "execute_shell_command"
 
     @classmethod
-    def execute(cls, shell_command: str) -> str:
-        process = subprocess.Popen(
-            shell_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    @property
+    def openai_schema(cls) -> Dict[str, Any]:
+        return OPENAI_SCHEMA
+
+    @classmethod
+    def execute(
+        cls, shell_command: str, max_bytes: Optional[int] = MAX_OUTPUT_BYTES
+    ) -> str:
+        exit_code, output = cls.execute_bytes(shell_command, max_bytes)
+        # Decoded only once, right before it is handed over to the LLM.
+        output = output.decode("utf-8", errors="replace")
+        return f"Exit code: {exit_code}, Output:\n{output}"
+
+    @classmethod
+    def execute_bytes(
+        cls, shell_command: str, max_bytes: Optional[int] = MAX_OUTPUT_BYTES
+    ) -> Tuple[int, bytes]:
+        """
+        Returns exit code and raw (not decoded) output of the shell command.
+        """
+        output = bytearray()
+        chunks = cls._read(shell_command, max_bytes)
+        try:
+            while True:
+                output += next(chunks)
+        except StopIteration as stop:
+            return stop.value, bytes(output)
+
+    @classmethod
+    def execute_stream(
+        cls, shell_command: str, max_bytes: Optional[int] = MAX_OUTPUT_BYTES
+    ) -> Generator[str, None, str]:
+        """
+        Yields output of the shell command as it arrives, returns the same
+        result as execute. Once output exceeds max_bytes, the command is
+        terminated.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output: List[str] = []
+        chunks = cls._read(shell_command, max_bytes)
+        try:
+            while True:
+                output.append(decoder.decode(next(chunks)))
+                yield output[-1]
+        except StopIteration as stop:
+            if tail := decoder.decode(b"", final=True):
+                output.append(tail)
+                yield tail
+            return f"Exit code: {stop.value}, Output:\n{''.join(output)}"
+
+    @classmethod
+    def _read(
+        cls, shell_command: str, max_bytes: Optional[int]
+    ) -> Generator[bytes, None, int]:
+        if not hasattr(os, "posix_spawn"):
+            process = subprocess.Popen(
+                shell_command,
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=0,
+            )
+            with process.stdout:
+                chunks = iter(process.stdout.readline, b"")
+                yield from cls._limit(chunks, max_bytes, process.terminate)
+            return process.wait()
+
+        # posix_spawn avoids copying page tables of the (large) parent process.
+        read_fd, write_fd = os.pipe()
+        output = None
+        try:
+            pid = cls._spawn_direct(shell_command, write_fd)
+            if pid is None and not has_terminal():
+                # Without terminal commands go to the persistent shell,
+                # unless it is still busy with another command.
+                output = shell.run(shell_command)
+            if pid is None and output is None:
+                # Keeps terminal and stdin of sgpt for prompts (sudo, ssh, ...).
+                pid = cls._spawn(["/bin/sh", "-c", shell_command], write_fd)
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        if output is not None:
+            os.close(read_fd)
+            # Shell is killed if output gets truncated.
+            exit_code = -signal.SIGKILL
+
+            def shell_output() -> Generator[bytes, None, None]:
+                nonlocal exit_code
+                exit_code = yield from output
+
+            yield from cls._limit(shell_output(), max_bytes, shell.stop)
+            output.close()
+            return exit_code
+        try:
+            chunks = iter(lambda: os.read(read_fd, 65536), b"")
+            yield from cls._limit(
+                chunks, max_bytes, lambda: os.kill(pid, signal.SIGTERM)
+            )
+        finally:
+            os.close(read_fd)
+            _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status)
+
+    @classmethod
+    def _limit(
+        cls,
+        chunks: Iterator[bytes],
+        max_bytes: Optional[int],
+        terminate: Callable[[], None],
+    ) -> Generator[bytes, None, None]:
+        remaining = max_bytes
+        for chunk in chunks:
+            if remaining is not None:
+                if len(chunk) > remaining:
+                    yield chunk[:remaining]
+                    terminate()
+                    yield TRUNCATED
+                    return
+                remaining -= len(chunk)
+            yield chunk
+
+    @classmethod
+    def _spawn_direct(cls, shell_command: str, output_fd: int) -> Optional[int]:
+        """
+        Spawns plain "binary + args" commands, None if shell is needed.
+        """
+        if SHELL_SYNTAX.search(shell_command):
+            return None
+        argv = shlex.split(shell_command)
+        if not argv or argv[0] in SHELL_BUILTINS:
+            return None
+        try:
+            return cls._spawn(argv, output_fd)
+        except OSError:
+            # Unknown or not executable commands, scripts without
+            # shebang: let the shell handle it.
+            return None
+
+    @classmethod
+    def _spawn(cls, argv: List[str], output_fd: int) -> int:
+        return os.posix_spawnp(
+            argv[0],
+            argv,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, output_fd, 1),
+                (os.POSIX_SPAWN_DUP2, output_fd, 2),
+            ],
         )
-        output, _ = process.communicate()
-        exit_code = process.returncode
-        return f"Exit code: {exit_code}, Output:\n{output.decode()}"
+
+
+# Schema never changes, so it is built once at import time.
+OPENAI_SCHEMA: Dict[str, Any] = super(Function, Function).openai_schema
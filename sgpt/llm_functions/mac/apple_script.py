@@ -1,8 +1,19 @@
-import subprocess
+import os
+import selectors
+import signal
+import sys
+import time
+from typing import Any, Dict
 
 from instructor import OpenAISchema
 from pydantic import Field
 
+if sys.platform != "darwin":
+    # Skipped by the loader, osascript exists only on macOS.
+    raise ImportError("execute_apple_script requires macOS.", path=__file__)
+
+TIMEOUT = 60
+
 
 class Function(OpenAISchema):
     """
@@ -20,14 +31,56 @@ class Function(OpenAISchema):
         title = "execute_apple_script"
 
     @classmethod
-    def execute(cls, apple_script):
-        script_command = ["osascript", "-e", apple_script]
+    @property
+    def openai_schema(cls) -> Dict[str, Any]:
+        return OPENAI_SCHEMA
+
+    @classmethod
+    def execute(cls, apple_script, timeout=TIMEOUT):
+        script_command = ["/usr/bin/osascript", "-e", apple_script]
         try:
-            process = subprocess.Popen(
-                script_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            output, _ = process.communicate()
+            read_fd, write_fd = os.pipe()
+            try:
+                pid = os.posix_spawn(
+                    script_command[0],
+                    script_command,
+                    os.environ,
+                    file_actions=[
+                        (os.POSIX_SPAWN_DUP2, write_fd, 1),
+                        (os.POSIX_SPAWN_DUP2, write_fd, 2),
+                    ],
+                )
+            except BaseException:
+                os.close(read_fd)
+                raise
+            finally:
+                os.close(write_fd)
+            output = bytearray()
+            # Reused for every read instead of allocating a new bytes object.
+            buffer = bytearray(65536)
+            deadline = time.monotonic() + timeout
+            try:
+                with selectors.DefaultSelector() as selector:
+                    selector.register(read_fd, selectors.EVENT_READ)
+                    while (remaining := deadline - time.monotonic()) > 0:
+                        if not selector.select(timeout=remaining):
+                            continue
+                        if not (size := os.readv(read_fd, [buffer])):
+                            break
+                        output += memoryview(buffer)[:size]
+                    else:
+                        # E.g. osascript waiting on a GUI permission prompt.
+                        os.kill(pid, signal.SIGKILL)
+            finally:
+                os.close(read_fd)
+                os.waitpid(pid, 0)
+            if remaining <= 0:
+                return f"Error: timed out after {timeout} s"
             output = output.decode("utf-8").strip()
             return f"Output: {output}"
         except Exception as e:
             return f"Error: {e}"
+
+
+# Schema never changes, so it is built once at import time.
+OPENAI_SCHEMA: Dict[str, Any] = super(Function, Function).openai_schema
@@ -4,17 +4,21 @@ This means it will call sgpt.py with command line arguments.
 Make sure you have your API key in place ~/.cfg/shell_gpt/.sgptrc
 or ENV variable OPENAI_API_KEY.
 It is useful for quick tests, saves a bit time.
+Tests are mostly waiting on the API, so they can run in parallel:
+pytest -n 8 --dist loadgroup tests/_integration.py
 """
 
 import json
 import os
 import subprocess
+import sys
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import ANY, patch
 from uuid import uuid4
 
+import pytest
 import typer
 from typer.testing import CliRunner
 
@@ -27,6 +31,8 @@ from sgpt.role import SystemRole
 runner = CliRunner()
 app = typer.Typer()
 app.command()(main)
+# Tests sharing the temp chat session must run in order on the same xdist worker.
+serial = pytest.mark.xdist_group("serial")
 
 
 class TestShellGpt(TestCase):
@@ -38,17 +44,18 @@ class TestShellGpt(TestCase):
         assert cfg.get("DEFAULT_MODEL") == "gpt-4-1106-preview"
         # Make sure we will not call any functions.
         assert cfg.get("OPENAI_USE_FUNCTIONS") == "false"
+        # Generated scripts are removed all at once in tearDownClass.
+        cls.temp_dir = TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
 
     @staticmethod
     def get_arguments(prompt, **kwargs):
-        arguments = [prompt]
-        for key, value in kwargs.items():
-            arguments.append(key)
-            if isinstance(value, bool):
-                continue
-            arguments.append(value)
-        arguments.append("--no-cache")
-        return arguments
+        # Flags are passed as {"--flag": True}, only the key is used.
+        options = (arg for pair in kwargs.items() for arg in pair if arg is not True)
+        return [prompt, *options, "--no-cache"]
 
     def test_default(self):
         dict_arguments = {
@@ -97,20 +104,20 @@ class TestShellGpt(TestCase):
         # Since output will be slightly different, there is no way how to test it precisely.
         assert "print" in result.stdout
         assert "*" in result.stdout
-        with NamedTemporaryFile("w+", delete=False) as file:
-            try:
-                compile(result.output, file.name, "exec")
-            except SyntaxError:
-                assert False, "The output is not valid Python code."  # noqa: B011
-            file.seek(0)
-            file.truncate()
-            file.write(result.output)
-            file_path = file.name
+        file_path = os.path.join(self.temp_dir.name, f"{uuid4()}.py")
+        try:
+            compile(result.output, file_path, "exec")
+        except SyntaxError:
+            assert False, "The output is not valid Python code."  # noqa: B011
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, result.output.encode())
+        finally:
+            os.close(fd)
         number_a = number_b = 2
         # Execute output code in the shell with arguments.
-        arguments = ["python", file.name, str(number_a), str(number_b)]
+        arguments = [sys.executable, file_path, str(number_a), str(number_b)]
         script_output = subprocess.run(arguments, stdout=subprocess.PIPE, check=True)
-        os.remove(file_path)
         assert script_output.stdout.decode().strip(), number_a * number_b
 
     def test_chat_default(self):
@@ -195,9 +202,15 @@ class TestShellGpt(TestCase):
         assert result.exit_code == 2
 
     def test_list_chat(self):
+        chat_name = f"test_{uuid4()}"
+        dict_arguments = {
+            "prompt": "Remember my favorite number: 6",
+            "--chat": chat_name,
+        }
+        runner.invoke(app, self.get_arguments(**dict_arguments))
         result = runner.invoke(app, ["--list-chats"])
         assert result.exit_code == 0
-        assert "test_" in result.stdout
+        assert chat_name in result.stdout
 
     def test_show_chat(self):
         chat_name = uuid4()
@@ -224,6 +237,7 @@ class TestShellGpt(TestCase):
         assert result.exit_code == 2
         assert "Only one of --shell, --describe-shell, and --code" in result.stdout
 
+    @serial
     def test_repl_default(
         self,
     ):
@@ -244,6 +258,7 @@ class TestShellGpt(TestCase):
         assert ">>> What is my favorite number + 2?" in result.stdout
         assert "8" in result.stdout
 
+    @serial
     def test_repl_multiline(
         self,
     ):
@@ -269,6 +284,7 @@ class TestShellGpt(TestCase):
         assert '"""' in result.stdout
         assert "8" in result.stdout
 
+    @serial
     def test_repl_shell(self):
         # Temp chat session from previous test should be overwritten.
         dict_arguments = {
@@ -288,7 +304,7 @@ class TestShellGpt(TestCase):
         assert "sort" in result.stdout
         chat_storage = cfg.get("CHAT_CACHE_PATH")
         tmp_chat = Path(chat_storage) / "temp"
-        chat_messages = json.loads(tmp_chat.read_text())
+        chat_messages = json.loads(tmp_chat.read_bytes())
         # TODO: Implement same check in chat mode tests.
         assert chat_messages[0]["content"].startswith("You are Shell Command Generator")
         assert chat_messages[0]["role"] == "system"
@@ -301,6 +317,7 @@ class TestShellGpt(TestCase):
         assert "sort" in chat_messages[4]["content"]
         assert chat_messages[4]["role"] == "assistant"
 
+    @serial
     def test_repl_describe_command(self):
         # Temp chat session from previous test should be overwritten.
         dict_arguments = {
@@ -318,7 +335,7 @@ class TestShellGpt(TestCase):
 
         chat_storage = cfg.get("CHAT_CACHE_PATH")
         tmp_chat = Path(chat_storage) / "temp"
-        chat_messages = json.loads(tmp_chat.read_text())
+        chat_messages = json.loads(tmp_chat.read_bytes())
         assert chat_messages[0]["content"].startswith(
             "You are Shell Command Descriptor"
         )
@@ -346,7 +363,7 @@ class TestShellGpt(TestCase):
 
         chat_storage = cfg.get("CHAT_CACHE_PATH")
         tmp_chat = Path(chat_storage) / dict_arguments["--repl"]
-        chat_messages = json.loads(tmp_chat.read_text())
+        chat_messages = json.loads(tmp_chat.read_bytes())
         assert chat_messages[0]["content"].startswith("You are Code Generator")
         assert chat_messages[0]["role"] == "system"
 
@@ -402,8 +419,8 @@ class TestShellGpt(TestCase):
         role = SystemRole.get("ShellGPT")
         handler = Handler(role=role)
         assert handler.color == color
-        os.environ["DEFAULT_COLOR"] = "red"
-        handler = Handler(role=role)
+        with patch.dict(os.environ, {"DEFAULT_COLOR": "red"}):
+            handler = Handler(role=role)
         assert handler.color == "red"
 
     def test_simple_stdin(self):
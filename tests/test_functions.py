@@ -0,0 +1,161 @@
+import os
+import signal
+import threading
+import time
+from unittest.mock import ANY, Mock, patch
+
+import pytest
+
+from sgpt.handlers.default_handler import DefaultHandler
+from sgpt.llm_functions.common import execute_shell
+from sgpt.llm_functions.common.execute_shell import Function, ShellCoprocess
+from sgpt.role import DefaultRoles, SystemRole
+
+
+def test_execute_shell_command():
+    result = Function.execute("echo hello; exit 3")
+    assert result == "Exit code: 3, Output:\nhello\n"
+
+
+@patch("os.posix_spawnp", wraps=os.posix_spawnp)
+def test_execute_shell_command_direct(posix_spawnp):
+    result = Function.execute("ls -d /")
+    posix_spawnp.assert_called_once_with("ls", ["ls", "-d", "/"], ANY, file_actions=ANY)
+    assert result == "Exit code: 0, Output:\n/\n"
+
+
+@patch("os.posix_spawnp", wraps=os.posix_spawnp)
+def test_execute_shell_command_builtin(posix_spawnp):
+    result = Function.execute("echo -e hello")
+    posix_spawnp.assert_not_called()
+    assert result == Function.execute("echo -e hello | cat")
+
+
+def test_execute_shell_command_not_found():
+    result = Function.execute("sgpt_no_such_command --flag")
+    assert result.startswith("Exit code: 127, Output:\n")
+
+
+def test_execute_shell_command_not_executable(tmp_path):
+    script = tmp_path / "script.sh"
+    script.write_text("echo hello\n")
+    result = Function.execute(str(script))
+    assert result.startswith("Exit code: 126, Output:\n")
+
+
+def test_execute_shell_command_no_shebang(tmp_path):
+    script = tmp_path / "script"
+    script.write_text("echo hello\n")
+    script.chmod(0o755)
+    result = Function.execute(str(script))
+    assert result == "Exit code: 0, Output:\nhello\n"
+
+
+@pytest.mark.parametrize("path", ["/etc/passwd/x", "{directory}"])
+def test_execute_shell_command_bad_path(tmp_path, path):
+    result = Function.execute(path.format(directory=tmp_path))
+    assert result.startswith(("Exit code: 126", "Exit code: 127"))
+
+
+def test_execute_shell_command_truncated():
+    result = Function.execute("yes", max_bytes=10)
+    assert result.startswith("Exit code: -15, Output:\ny\ny\ny\ny\ny\n")
+    assert result.endswith("\n...[truncated]")
+
+
+def test_execute_shell_command_stream():
+    stream = Function.execute_stream("echo one; sleep 0.5; echo two; exit 3")
+    start = time.monotonic()
+    assert next(stream) == "one\n"
+    assert time.monotonic() - start < 0.4
+    with pytest.raises(StopIteration) as stop:
+        assert next(stream) == "two\n"
+        next(stream)
+    assert stop.value.value == "Exit code: 3, Output:\none\ntwo\n"
+
+
+@patch("sgpt.handlers.handler.get_function_stream")
+def test_function_call_streams_output(get_function_stream, monkeypatch):
+    monkeypatch.setenv("SHOW_FUNCTIONS_OUTPUT", "true")
+    get_function_stream.return_value = Function.execute_stream
+    handler = DefaultHandler(SystemRole.get(DefaultRoles.DEFAULT.value), False)
+    messages = []
+    arguments = '{"shell_command": "echo one; sleep 0.5; echo two"}'
+    chunks = handler.handle_function_call(messages, "execute_shell_command", arguments)
+    start = time.monotonic()
+    head = "".join(iter(lambda: next(chunks), "one\n"))
+    assert time.monotonic() - start < 0.4
+    assert head.endswith("```text\n")
+    assert "".join(chunks) == "two\n\n```\n"
+    assert messages[-1] == {
+        "role": "function",
+        "content": "Exit code: 0, Output:\none\ntwo\n",
+        "name": "execute_shell_command",
+    }
+
+
+@pytest.fixture
+def persistent_shell(monkeypatch):
+    monkeypatch.setattr(execute_shell, "has_terminal", lambda: False)
+    shell = ShellCoprocess()
+    monkeypatch.setattr(execute_shell, "shell", shell)
+    yield shell
+    shell.stop()
+
+
+def test_persistent_shell_reused(persistent_shell):
+    first = Function.execute("echo $$")
+    second = Function.execute("echo $$ && exit 4")
+    assert first.startswith("Exit code: 0, Output:\n")
+    assert second.startswith("Exit code: 4, Output:\n")
+    assert first.split("\n")[1] == second.split("\n")[1]
+
+
+def test_persistent_shell_isolated(persistent_shell):
+    assert Function.execute("cd / && exit 5") == "Exit code: 5, Output:\n"
+    assert Function.execute("if then").startswith("Exit code: 2, Output:\n")
+    result = Function.execute("pwd; printf no-newline")
+    assert result == f"Exit code: 0, Output:\n{os.getcwd()}\nno-newline"
+
+
+def test_persistent_shell_streams_output(persistent_shell):
+    stream = Function.execute_stream("echo one; sleep 0.5; echo two")
+    start = time.monotonic()
+    assert next(stream) == "one\n"
+    assert time.monotonic() - start < 0.4
+    assert "".join(stream) == "two\n"
+
+
+def test_persistent_shell_truncated(persistent_shell):
+    result = Function.execute("yes | cat", max_bytes=10)
+    assert result.startswith("Exit code: -9, Output:\ny\ny\ny\ny\ny\n")
+    assert result.endswith("\n...[truncated]")
+    assert Function.execute("echo ok | cat") == "Exit code: 0, Output:\nok\n"
+
+
+def test_terminal_skips_persistent_shell(monkeypatch):
+    monkeypatch.setattr(execute_shell, "has_terminal", lambda: True)
+    run = Mock()
+    monkeypatch.setattr(execute_shell.shell, "run", run)
+    assert Function.execute("echo ok | cat") == "Exit code: 0, Output:\nok\n"
+    run.assert_not_called()
+
+
+def test_persistent_shell_busy(persistent_shell):
+    stream = Function.execute_stream("echo one; sleep 0.5; echo two")
+    assert next(stream) == "one\n"
+    # Shell is busy with open stream, others must not wait for it.
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(Function.execute("echo other | cat")),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(timeout=5)
+    assert results == ["Exit code: 0, Output:\nother\n"]
+    signal.alarm(5)
+    try:
+        assert Function.execute("echo same | cat") == "Exit code: 0, Output:\nsame\n"
+    finally:
+        signal.alarm(0)
+    assert "".join(stream) == "two\n"